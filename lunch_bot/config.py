@@ -1,5 +1,7 @@
 """URLやファイルパスなどの定数を管理するモジュール"""
 
+import os
+from importlib.util import find_spec
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -17,12 +19,24 @@ IMG_DIR.mkdir(exist_ok=True)
 # データファイル
 MENU_FILE = PROJECT_ROOT / "menu_data.json"
 COOKIE_FILE = PROJECT_ROOT / ".bento_cookies.json"
+HTTP_CACHE_FILE = PROJECT_ROOT / ".bento_http_cache.json"
+OCR_CACHE_FILE = PROJECT_ROOT / ".ocr_cache.json"
 
 # メニューのPDFが掲載されているホームページのURL
 MENU_PAGE_URL = "https://sumiyoshi-bento.com/menu/"
 # 注文システムのベースのURL
 ORDER_BASE_URL = "https://sumiyoshi.azurewebsites.net"
 
+# Gemini OCR の同時実行数と 1 秒あたりの最大リクエスト数
+OCR_CONCURRENCY = int(os.getenv("OCR_CONCURRENCY", "4"))
+OCR_RPS = float(os.getenv("OCR_RPS", "1"))
+# 1 回の generate_content にまとめる PDF の数 (1 で従来どおり 1 件ずつ)
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", "3"))
+
+# BeautifulSoup のパーサー（lxml があれば高速な C 実装を使う）
+# 起動時間を抑えるため import はせず、インストール有無だけを確認する
+HTML_PARSER = "lxml" if find_spec("lxml") else "html.parser"
+
 # HTTPリクエストのヘッダー（ブラウザっぽくしてBOT検知回避）
 USER_AGENT = (
     "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
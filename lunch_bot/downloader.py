@@ -2,36 +2,161 @@
 
 sumiyoshi-bento.com/menu/ から掲載中の全メニュー PDF を取得し、
 img/ ディレクトリに保存する。
+httpx.AsyncClient で全 PDF を並行ダウンロードする。
+ETag / Last-Modified を記録し、条件付き GET で未更新のページ・PDF の再取得を省く。
 """
 
+import asyncio
+import json
 import logging
 import re
+import string
+from concurrent.futures import ThreadPoolExecutor
+from html import unescape
 from pathlib import Path
+from typing import Awaitable, TypeVar
 from urllib.parse import unquote, urljoin
 
 import httpx
-from bs4 import BeautifulSoup
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
 
-from lunch_bot.config import IMG_DIR, MENU_PAGE_URL
+from lunch_bot.config import (
+    BROWSER_HEADERS,
+    HTML_PARSER,
+    HTTP_CACHE_FILE,
+    IMG_DIR,
+    MENU_PAGE_URL,
+)
 
 logger = logging.getLogger(__name__)
 
+# 同時ダウンロード数の上限
+DOWNLOAD_CONCURRENCY = 8
+# ストリーミング書き込みのチャンクサイズ
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
 
-def fetch_pdf_urls() -> list[str]:
-    """メニューページをスクレイピングし、掲載中の全 PDF リンクを抽出する。"""
-    logger.info("メニューページを取得中: %s", MENU_PAGE_URL)
-    resp = httpx.get(MENU_PAGE_URL, follow_redirects=True, timeout=30)
-    resp.raise_for_status()
+# メニューページ中の PDF リンク (<a> の href 属性のみ。data-href や <link> は除く)
+_PDF_HREF_RE = re.compile(
+    r'<a\b[^>]*?\shref=["\']([^"\']+?\.pdf)["\']', re.IGNORECASE
+)
+
+# ASCII のみのファイル名用: 英数字と "_-." 以外を "_" に置換する変換表
+_ASCII_FILENAME_TABLE = str.maketrans(
+    {
+        c: "_"
+        for c in map(chr, range(128))
+        if c not in string.ascii_letters + string.digits + "_-."
+    }
+)
+
+T = TypeVar("T")
+
+# URL → {"etag", "last_modified", ...} の条件付き GET 用キャッシュ
+HttpCache = dict[str, dict]
+
+
+def _load_http_cache() -> HttpCache:
+    """条件付き GET 用のキャッシュを読み込む。"""
+    if not HTTP_CACHE_FILE.exists():
+        return {}
+    try:
+        return json.loads(HTTP_CACHE_FILE.read_text(encoding="utf-8"))
+    except json.JSONDecodeError as e:
+        logger.warning("HTTP キャッシュの読み込みに失敗: %s", e)
+        return {}
+
+
+def _save_http_cache(cache: HttpCache) -> None:
+    """条件付き GET 用のキャッシュを保存する。"""
+    HTTP_CACHE_FILE.write_text(
+        json.dumps(cache, indent=2, ensure_ascii=False), encoding="utf-8"
+    )
+
+
+def _conditional_headers(entry: dict) -> dict[str, str]:
+    """キャッシュエントリから If-None-Match / If-Modified-Since ヘッダーを作る。"""
+    headers: dict[str, str] = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def _cache_entry(resp: httpx.Response, **extra) -> dict:
+    """レスポンスヘッダーからキャッシュエントリを作る。"""
+    return {
+        "etag": resp.headers.get("etag"),
+        "last_modified": resp.headers.get("last-modified"),
+        **extra,
+    }
 
-    soup = BeautifulSoup(resp.text, "html.parser")
+
+def _resume_validator(resp: httpx.Response) -> str | None:
+    """.part の再開時に If-Range で送れるバリデーター (強い ETag か Last-Modified)。"""
+    etag = resp.headers.get("etag")
+    if etag and not etag.startswith("W/"):  # 弱い ETag は If-Range に使えない
+        return etag
+    return resp.headers.get("last-modified")
+
+
+def _extract_pdf_links_soup(html: str) -> list[str]:
+    """BeautifulSoup で <a href> を走査して PDF リンクを抽出する (フォールバック用)。"""
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    # <a href> だけをパースしてツリー構築を最小限にする
+    soup = BeautifulSoup(html, HTML_PARSER, parse_only=SoupStrainer("a", href=True))
     pdf_urls: list[str] = []
+    seen: set[str] = set()
 
     for a_tag in soup.find_all("a", href=True):
         href = a_tag["href"]
         if href.lower().endswith(".pdf"):
             full_url = urljoin(MENU_PAGE_URL, href)
-            if full_url not in pdf_urls:
+            if full_url not in seen:
+                seen.add(full_url)
                 pdf_urls.append(full_url)
+    return pdf_urls
+
+
+def _extract_pdf_links(html: str) -> list[str]:
+    """正規表現で href="...pdf" を抽出する。順序を保って重複を除去。"""
+    return list(
+        dict.fromkeys(
+            urljoin(MENU_PAGE_URL, unescape(href))
+            for href in _PDF_HREF_RE.findall(html)
+        )
+    )
+
+
+async def fetch_pdf_urls(
+    client: httpx.AsyncClient,
+    cache: HttpCache | None = None,
+    *,
+    fallback: bool = False,
+) -> list[str]:
+    """メニューページをスクレイピングし、掲載中の全 PDF リンクを抽出する。
+
+    通常は正規表現で抽出し、fallback=True または正規表現で 1 件も
+    見つからない場合は BeautifulSoup で解析する。
+    cache を渡すと条件付き GET を行い、304 なら前回抽出したリンクを返す。
+    """
+    entry = cache.get(MENU_PAGE_URL, {}) if cache is not None else {}
+    headers = _conditional_headers(entry) if "pdf_urls" in entry else None
+
+    logger.info("メニューページを取得中: %s", MENU_PAGE_URL)
+    resp = await client.get(MENU_PAGE_URL, headers=headers, timeout=30)
+    if resp.status_code == 304:
+        logger.info("メニューページは未更新です (304)")
+        return entry["pdf_urls"]
+    resp.raise_for_status()
+
+    pdf_urls = [] if fallback else _extract_pdf_links(resp.text)
+    if not pdf_urls:
+        pdf_urls = _extract_pdf_links_soup(resp.text)
+
+    if cache is not None:
+        cache[MENU_PAGE_URL] = _cache_entry(resp, pdf_urls=pdf_urls)
 
     logger.info("PDF リンクを %d 件検出", len(pdf_urls))
     return pdf_urls
@@ -40,30 +165,134 @@ def fetch_pdf_urls() -> list[str]:
 def _convert_url_to_filename(url: str) -> str:
     """URL からファイル名を生成する。日本語ファイル名はデコードして保持。"""
     decoded = unquote(url.split("/")[-1])
+    if decoded.isascii():
+        return decoded.translate(_ASCII_FILENAME_TABLE)
     return re.sub(r"[^\w\-.\u3000-\u9fff\uff00-\uffef]", "_", decoded)
 
 
-def download_pdf(url: str, dest_dir: Path | None = None) -> Path:
-    """単一の PDF をダウンロードし、ローカルパスを返す。既に存在すればスキップ。"""
+def _is_transient_error(exc: BaseException) -> bool:
+    """再試行で回復が見込める一時的なエラー (接続エラー / 5xx) かどうか。"""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return isinstance(exc, httpx.TransportError)
+
+
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=1, min=1, max=10),
+    retry=retry_if_exception(_is_transient_error),
+    reraise=True,
+)
+async def download_pdf(
+    client: httpx.AsyncClient,
+    url: str,
+    dest_dir: Path | None = None,
+    cache: HttpCache | None = None,
+) -> Path:
+    """単一の PDF をダウンロードし、ローカルパスを返す。
+
+    既に存在する場合、cache に ETag / Last-Modified があれば条件付き GET で
+    更新を確認し (304 ならスキップ)、なければ従来どおりスキップする。
+    本文はメモリに溜めず .part ファイルへ逐次書き込み、完了後にリネームする。
+    書き込み開始時に ETag / Last-Modified を .part.json に記録しておき、前回途中で
+    中断した .part があれば Range + If-Range で続きから再開する (記録がなければ最初から)。
+    接続エラーや 5xx は指数バックオフで再試行する (途中まで取れた分は再開される)。
+    """
     dest_dir = dest_dir or IMG_DIR
     dest_dir.mkdir(parents=True, exist_ok=True)
 
     filename = _convert_url_to_filename(url)
     filepath = dest_dir / filename
+    part_path = filepath.with_name(filepath.name + ".part")
+    validator_path = filepath.with_name(filepath.name + ".part.json")
+    entry = cache.get(url, {}) if cache is not None else {}
 
+    offset = 0
     if filepath.exists():
-        logger.info("スキップ (既存): %s", filepath.name)
-        return filepath
+        # サイズが食い違う (壊れた) ファイルは条件なしで取り直す
+        if entry and entry.get("size") != filepath.stat().st_size:
+            headers = {}
+        else:
+            headers = _conditional_headers(entry)
+            if not headers:
+                logger.info("スキップ (既存): %s", filepath.name)
+                return filepath
+    else:
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        validator = None
+        if offset and validator_path.exists():
+            try:
+                validator = json.loads(validator_path.read_text(encoding="utf-8"))
+            except (OSError, json.JSONDecodeError):
+                pass
+        if offset and isinstance(validator, str):
+            # サーバー側で更新されていれば 206 ではなく全体 (200) が返る
+            headers = {"Range": f"bytes={offset}-", "If-Range": validator}
+        else:
+            # .part の取得元を確認できないので、別の内容を継ぎ足さないよう最初から取り直す
+            offset = 0
+            headers = {}
 
     logger.info("ダウンロード中: %s", url)
-    resp = httpx.get(url, follow_redirects=True, timeout=60)
-    resp.raise_for_status()
+    # PDF は圧縮させない (Range のオフセットを .part に書いたバイト数と一致させる)
+    headers["Accept-Encoding"] = "identity"
+    async with client.stream("GET", url, headers=headers, timeout=60) as resp:
+        if resp.status_code == 304:
+            logger.info("スキップ (未更新): %s", filepath.name)
+            return filepath
+        restart = resp.status_code == 416 and offset > 0
+        if restart:
+            # .part がサーバー側のファイルと食い違っている → 捨てて最初から取り直す
+            logger.info("再開できないため最初から取得: %s", filepath.name)
+            part_path.unlink(missing_ok=True)
+            validator_path.unlink(missing_ok=True)
+        else:
+            resp.raise_for_status()
+            await _stream_to_part(resp, part_path, validator_path, filepath.name, offset)
+
+    if restart:
+        # .part を消したので Range なしで取り直す (再び 416 でもここには来ない)
+        return await download_pdf(client, url, dest_dir, cache)
 
-    filepath.write_bytes(resp.content)
-    logger.info("保存完了: %s (%.1f KB)", filepath.name, len(resp.content) / 1024)
+    await asyncio.to_thread(part_path.replace, filepath)
+    validator_path.unlink(missing_ok=True)
+    size = filepath.stat().st_size
+    if cache is not None:
+        cache[url] = _cache_entry(resp, size=size)
+    logger.info("保存完了: %s (%.1f KB)", filepath.name, size / 1024)
     return filepath
 
 
+async def _stream_to_part(
+    resp: httpx.Response,
+    part_path: Path,
+    validator_path: Path,
+    name: str,
+    offset: int,
+) -> None:
+    """レスポンス本文を .part に書き込む。206 なら続きから追記、200 なら最初から書き直す。"""
+    resumed = resp.status_code == 206
+    if resumed:
+        logger.info("ダウンロード再開: %s (%.1f KB から)", name, offset / 1024)
+    else:
+        # 次回の再開に備え、この本文のバリデーターを書き込み前に記録する
+        validator = _resume_validator(resp)
+        if validator:
+            await asyncio.to_thread(
+                validator_path.write_text, json.dumps(validator), encoding="utf-8"
+            )
+        else:
+            validator_path.unlink(missing_ok=True)
+
+    # ディスク書き込みはスレッドに逃がし、他のダウンロードを止めない
+    f = await asyncio.to_thread(part_path.open, "ab" if resumed else "wb")
+    try:
+        async for chunk in resp.aiter_bytes(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            await asyncio.to_thread(f.write, chunk)
+    finally:
+        await asyncio.to_thread(f.close)
+
+
 def _cleanup_old_pdfs(pdf_urls: list[str], dest_dir: Path) -> None:
     """サイトに掲載されていないローカル PDF を削除する。"""
     # サイトのURLから期待されるファイル名のセットを作成
@@ -75,27 +304,83 @@ def _cleanup_old_pdfs(pdf_urls: list[str], dest_dir: Path) -> None:
             logger.info("古い PDF を削除: %s", local_pdf.name)
             local_pdf.unlink()
 
+    # 掲載されなくなった PDF の途中ファイル (.part / .part.json) も削除
+    for pattern in ("*.pdf.part", "*.pdf.part.json"):
+        for part in dest_dir.glob(pattern):
+            if part.name.removesuffix(".json").removesuffix(".part") not in expected_filenames:
+                logger.info("古い途中ファイルを削除: %s", part.name)
+                part.unlink()
 
-def download_all_menus(dest_dir: Path | None = None) -> list[Path]:
-    """メニューページから全 PDF をダウンロードし、パスのリストを返す。"""
+
+async def _bounded(sem: asyncio.Semaphore, coro: Awaitable[T]) -> T:
+    """セマフォで同時実行数を制限してコルーチンを実行する。"""
+    async with sem:
+        return await coro
+
+
+async def download_all_menus_async(dest_dir: Path | None = None) -> list[Path]:
+    """メニューページから全 PDF を並行ダウンロードし、パスのリストを返す。"""
     dest_dir = dest_dir or IMG_DIR
     dest_dir.mkdir(parents=True, exist_ok=True)
+    cache = _load_http_cache()
 
-    pdf_urls = fetch_pdf_urls()
-    if not pdf_urls:
-        logger.warning("メニュー PDF が見つかりませんでした。")
-        return []
+    # transport を渡す場合、http2 / limits は transport 側に指定する
+    transport = httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        retries=2,  # 接続確立の失敗を再試行する
+    )
+    async with httpx.AsyncClient(
+        transport=transport,
+        follow_redirects=True,
+        # brotli 未導入の httpx は br を展開できないため、展開できる形式だけを広告する
+        headers={**BROWSER_HEADERS, "Accept-Encoding": "gzip, deflate"},
+    ) as client:
+        pdf_urls = await fetch_pdf_urls(client, cache)
+        if not pdf_urls:
+            logger.warning("メニュー PDF が見つかりませんでした。")
+            return []
+
+        # サイトにない古い PDF を削除
+        _cleanup_old_pdfs(pdf_urls, dest_dir)
 
-    # サイトにない古い PDF を削除
-    _cleanup_old_pdfs(pdf_urls, dest_dir)
+        sem = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+        results = await asyncio.gather(
+            *(
+                _bounded(sem, download_pdf(client, url, dest_dir, cache))
+                for url in pdf_urls
+            ),
+            return_exceptions=True,
+        )
 
+    # 掲載されなくなった URL のエントリは捨てて保存する
+    keep = {MENU_PAGE_URL, *pdf_urls}
+    _save_http_cache({url: entry for url, entry in cache.items() if url in keep})
+
+    # 結果は pdf_urls の順序を保つ
     downloaded: list[Path] = []
-    for url in pdf_urls:
-        try:
-            path = download_pdf(url, dest_dir)
-            downloaded.append(path)
-        except Exception as e:
-            logger.error("ダウンロード失敗 (%s): %s", url, e)
+    for url, result in zip(pdf_urls, results):
+        if isinstance(result, BaseException):
+            logger.error("ダウンロード失敗 (%s): %s", url, result)
+        else:
+            downloaded.append(result)
 
     logger.info("合計 %d 件の PDF を取得しました。", len(downloaded))
     return downloaded
+
+
+def download_all_menus(dest_dir: Path | None = None) -> list[Path]:
+    """download_all_menus_async の同期ラッパー。
+
+    MCP ツールのようにイベントループ上から呼ばれた場合は
+    asyncio.run() が使えないため、別スレッドで実行する。
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(download_all_menus_async(dest_dir))
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(
+            asyncio.run, download_all_menus_async(dest_dir)
+        ).result()
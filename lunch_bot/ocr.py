@@ -3,18 +3,46 @@ Gemini API で PDF からメニュー JSON を生成する
 
 google-genai を使い、PDF を直接アップロードして OCR → JSON 変換する。
 複数 PDF に対応し、結果をマージして重複日付は除去する。
+OCR 結果は PDF の内容ハッシュでキャッシュし、同じ PDF は Gemini を呼ばずに再利用する。
+複数 PDF はスレッドプールで並行に OCR し、レート制限 (429) は指数バックオフで再試行する。
+小さな PDF は数件ずつ 1 回の generate_content にまとめて往復回数を減らす。
 """
 
+import hashlib
 import io
 import json
 import logging
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-from google import genai
+try:
+    import orjson
+except ImportError:  # orjson が無い環境では標準の json を使う
+    orjson = None
+from tenacity import (
+    retry,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential,
+)
 
-from lunch_bot.config import IMG_DIR, MENU_FILE
+from lunch_bot.config import (
+    IMG_DIR,
+    MENU_FILE,
+    OCR_BATCH_SIZE,
+    OCR_CACHE_FILE,
+    OCR_CONCURRENCY,
+    OCR_RPS,
+)
+
+# google-genai は依存ツリーが大きいため、OCR を実行するときだけ import する
+if TYPE_CHECKING:
+    from google import genai
 
 logger = logging.getLogger(__name__)
 
@@ -40,38 +68,89 @@ MENU_EXTRACTION_PROMPT = """\
 ]
 """
 
+# 複数 PDF をまとめて OCR するときに MENU_EXTRACTION_PROMPT の後ろに付ける指示
+BATCH_PROMPT_SUFFIX = """
+追加ルール (複数ファイル):
+- {count} 個の PDF が添付されています。各 PDF の直前にファイル名を示しています。
+- 上記ルールで PDF ごとに個別に抽出し、上記の JSON 配列の代わりに、ファイル名をキー、
+  その PDF のメニュー配列を値とする 1 つの JSON オブジェクトで出力してください。
+  キーは次のファイル名をそのまま使ってください:
+{file_list}
+
+フォーマット:
+{{
+  "<ファイル名>": [ {{ "date": "YYYY-MM-DD", "ai_lunch": "...", "wafu_lunch": "..." }} ]
+}}
+"""
+
+
+def _json_loads(data: str | bytes) -> list | dict:
+    """JSON をデコードする (orjson があれば使う)。"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_dumps(obj: list | dict) -> bytes:
+    """JSON を UTF-8 バイト列にエンコードする (orjson があれば使う)。"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+class _RateLimiter:
+    """スレッド間で共有する、リクエスト間の最小間隔を保証するリミッター。"""
+
+    def __init__(self, rps: float) -> None:
+        self._interval = 1.0 / rps if rps > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_at = 0.0
+
+    def wait(self) -> None:
+        """次のリクエストを送ってよい時刻まで待機する。"""
+        if not self._interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_at - now
+            self._next_at = max(now, self._next_at) + self._interval
+        if delay > 0:
+            time.sleep(delay)
+
 
-def _get_client() -> genai.Client:
+def _get_client() -> "genai.Client":
     """Gemini API クライアントを取得する。"""
+    from google import genai
+
     api_key = os.getenv("GOOGLE_API_KEY")
     if not api_key:
         raise RuntimeError("GOOGLE_API_KEY が .env に設定されていません。")
     return genai.Client(api_key=api_key)
 
 
-def ocr_pdf(client: genai.Client, pdf_path: Path) -> list[dict]:
-    """単一 PDF を Gemini で OCR し、メニューリストを返す。"""
-    logger.info("OCR 処理中: %s", pdf_path.name)
-
-    now = datetime.now()
-    prompt = MENU_EXTRACTION_PROMPT.format(
+def build_prompt(now: datetime | None = None) -> str:
+    """年の決定ルールを埋め込んだ抽出プロンプトを生成する。"""
+    now = now or datetime.now()
+    return MENU_EXTRACTION_PROMPT.format(
         current_year=now.year,
         next_year=now.year + 1,
     )
 
-    # ファイルをアップロード (日本語ファイル名対応のためバイナリで渡す)
+
+def _upload_pdf(client: "genai.Client", pdf_path: Path):
+    """PDF を Gemini にアップロードする。"""
+    # 日本語ファイル名対応のためバイナリで渡す
     uploaded = client.files.upload(
         file=io.BytesIO(pdf_path.read_bytes()),
         config={"mime_type": "application/pdf"},
     )
-    logger.info("Gemini にアップロード完了: %s", uploaded.name)
+    logger.info("Gemini にアップロード完了: %s (%s)", uploaded.name, pdf_path.name)
+    return uploaded
 
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=[uploaded, prompt],
-    )
 
-    raw_text = response.text.strip()
+def _parse_json_response(text: str) -> list | dict:
+    """Gemini の応答テキストから JSON を取り出してデコードする。"""
+    raw_text = text.strip()
 
     # マークダウンブロックが含まれている場合は除去してJSON部分だけ抽出する
     if raw_text.startswith("```"):
@@ -81,19 +160,189 @@ def ocr_pdf(client: genai.Client, pdf_path: Path) -> list[dict]:
     raw_text = raw_text.strip()
 
     try:
-        menu_list = json.loads(raw_text)
-    except json.JSONDecodeError as e:
+        return _json_loads(raw_text)
+    except json.JSONDecodeError as e:  # orjson.JSONDecodeError もこのサブクラス
         logger.error("JSON パース失敗: %s\n---\n%s", e, raw_text[:500])
         raise
 
+
+_MENU_KEYS = ("date", "ai_lunch", "wafu_lunch")
+
+
+def _validate_menu_list(data: object, source: str) -> list[dict]:
+    """OCR 結果から date / ai_lunch / wafu_lunch (文字列) を持つ行だけを返す。
+
+    配列でなければ JSON のパース失敗と同様、その PDF の失敗として ValueError を送出する。
+    形式の不正な行は警告を出して読み飛ばし、残りの行は使う。
+    """
+    if not isinstance(data, list):
+        raise ValueError(f"{source}: メニューが配列ではありません ({type(data).__name__})")
+    valid: list[dict] = []
+    for item in data:
+        if isinstance(item, dict) and all(isinstance(item.get(key), str) for key in _MENU_KEYS):
+            valid.append(item)
+        else:
+            logger.warning("%s: 形式の不正なメニュー項目を無視: %s", source, str(item)[:100])
+    return valid
+
+
+def ocr_pdf(
+    client: "genai.Client", pdf_path: Path, prompt: str | None = None
+) -> list[dict]:
+    """単一 PDF を Gemini で OCR し、メニューリストを返す。
+
+    prompt を省略した場合はその場で build_prompt() する。
+    """
+    logger.info("OCR 処理中: %s", pdf_path.name)
+    prompt = prompt or build_prompt()
+
+    uploaded = _upload_pdf(client, pdf_path)
+    response = client.models.generate_content(
+        model="gemini-2.5-flash",
+        contents=[uploaded, prompt],
+    )
+    menu_list = _validate_menu_list(_parse_json_response(response.text), pdf_path.name)
+
     logger.info("  → %d 日分のメニューを抽出", len(menu_list))
     return menu_list
 
 
+def ocr_pdfs_batch(
+    client: "genai.Client", pdf_paths: list[Path], prompt: str | None = None
+) -> dict[Path, list[dict]]:
+    """複数 PDF を 1 回の generate_content で OCR し、PDF ごとのメニューリストを返す。
+
+    応答がファイル名をキーとし、各値がメニュー配列の JSON オブジェクトでなければ
+    ValueError を送出する。
+    """
+    if len(pdf_paths) == 1:
+        return {pdf_paths[0]: ocr_pdf(client, pdf_paths[0], prompt)}
+
+    names = [p.name for p in pdf_paths]
+    logger.info("OCR 処理中 (%d 件まとめて): %s", len(pdf_paths), ", ".join(names))
+    prompt = (prompt or build_prompt()) + BATCH_PROMPT_SUFFIX.format(
+        count=len(pdf_paths),
+        file_list="\n".join(f"  - {name}" for name in names),
+    )
+
+    contents: list = []
+    for pdf_path in pdf_paths:
+        contents.append(f"ファイル名: {pdf_path.name}")
+        contents.append(_upload_pdf(client, pdf_path))
+    contents.append(prompt)
+
+    response = client.models.generate_content(
+        model="gemini-2.5-flash",
+        contents=contents,
+    )
+    data = _parse_json_response(response.text)
+
+    if not isinstance(data, dict):
+        raise ValueError("まとめて OCR した結果にファイル名ごとのメニュー配列がありません。")
+
+    # どれかのファイルの値が配列でなければ ValueError となり、呼び出し側で 1 件ずつ処理し直す
+    results = {
+        pdf_path: _validate_menu_list(data.get(pdf_path.name), pdf_path.name)
+        for pdf_path in pdf_paths
+    }
+    for pdf_path, menus in results.items():
+        logger.info("  → %s: %d 日分のメニューを抽出", pdf_path.name, len(menus))
+    return results
+
+
+def _is_rate_limit(exc: BaseException) -> bool:
+    """429 (RESOURCE_EXHAUSTED / クォータ超過) のエラーかどうかを判定する。"""
+    from google.genai import errors as genai_errors
+
+    if isinstance(exc, genai_errors.APIError):
+        return exc.code == 429
+    return "RESOURCE_EXHAUSTED" in str(exc)
+
+
+_rate_limit_retry = retry(
+    wait=wait_exponential(min=1, max=30),
+    stop=stop_after_attempt(3),
+    retry=retry_if_exception(_is_rate_limit),
+    reraise=True,
+)
+
+
+@_rate_limit_retry
+def _ocr_with_retry(
+    client: "genai.Client", pdf_path: Path, prompt: str, limiter: _RateLimiter
+) -> list[dict]:
+    """レート制限を守りつつ ocr_pdf を実行する。429 は指数バックオフで再試行。"""
+    limiter.wait()
+    return ocr_pdf(client, pdf_path, prompt)
+
+
+@_rate_limit_retry
+def _ocr_batch_with_retry(
+    client: "genai.Client",
+    pdf_paths: list[Path],
+    prompt: str,
+    limiter: _RateLimiter,
+) -> dict[Path, list[dict]]:
+    """レート制限を守りつつ ocr_pdfs_batch を実行する。429 は指数バックオフで再試行。"""
+    limiter.wait()
+    return ocr_pdfs_batch(client, pdf_paths, prompt)
+
+
+def _ocr_batch_or_single(
+    client: "genai.Client",
+    pdf_paths: list[Path],
+    prompt: str,
+    limiter: _RateLimiter,
+) -> dict[Path, list[dict]]:
+    """まとめて OCR し、応答が解釈できなければ 1 件ずつ OCR し直す。"""
+    try:
+        return _ocr_batch_with_retry(client, pdf_paths, prompt, limiter)
+    except (json.JSONDecodeError, ValueError) as e:
+        if len(pdf_paths) == 1:
+            raise
+        logger.warning("まとめて OCR に失敗したため 1 件ずつ処理します: %s", e)
+
+    results: dict[Path, list[dict]] = {}
+    for pdf_path in pdf_paths:
+        try:
+            results[pdf_path] = _ocr_with_retry(client, pdf_path, prompt, limiter)
+        except Exception as e:
+            logger.error("OCR 失敗 (%s): %s", pdf_path.name, e)
+    return results
+
+
+def _ocr_cache_key(pdf_path: Path, prompt: str) -> str:
+    """OCR キャッシュのキー。年の決定ルールを含むプロンプトも結果に影響するため混ぜる。"""
+    h = hashlib.sha256(pdf_path.read_bytes())
+    h.update(prompt.encode("utf-8"))
+    return h.hexdigest()
+
+
+def _load_ocr_cache() -> dict[str, list[dict]]:
+    """OCR 結果キャッシュ ({キー: メニューリスト}) を読み込む。"""
+    if not OCR_CACHE_FILE.exists():
+        return {}
+    try:
+        cache = _json_loads(OCR_CACHE_FILE.read_bytes())
+    except json.JSONDecodeError as e:
+        logger.warning("OCR キャッシュの読み込みに失敗: %s", e)
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def _save_ocr_cache(cache: dict[str, list[dict]]) -> None:
+    """OCR 結果キャッシュを一時ファイル経由で原子的に保存する。"""
+    tmp_path = OCR_CACHE_FILE.with_name(OCR_CACHE_FILE.name + ".tmp")
+    tmp_path.write_bytes(_json_dumps(cache))
+    os.replace(tmp_path, OCR_CACHE_FILE)
+
+
 def ocr_all_menus(pdf_paths: list[Path] | None = None) -> list[dict]:
     """複数 PDF を OCR し、日付で重複排除したメニューリストを返す。
 
     pdf_paths が未指定の場合、IMG_DIR 配下の全 PDF を処理する。
+    PDF は OCR_BATCH_SIZE 件ずつまとめ、各まとまりを並行に OCR する。
+    キャッシュ済みの PDF は OCR しない。
     """
     if pdf_paths is None:
         pdf_paths = sorted(IMG_DIR.glob("*.pdf"))
@@ -102,36 +351,117 @@ def ocr_all_menus(pdf_paths: list[Path] | None = None) -> list[dict]:
         logger.warning("処理対象の PDF がありません。")
         return []
 
-    client = _get_client()
-    all_menus: dict[str, dict] = {}
-
+    # 1 回の実行中は年が変わらないので、全 PDF で同じプロンプトを使う
+    prompt = build_prompt()
+    cache_keys = {pdf_path: _ocr_cache_key(pdf_path, prompt) for pdf_path in pdf_paths}
+    old_cache = _load_ocr_cache()
+    # 今回の PDF に対応しないエントリは捨てる (HTTP キャッシュと同様に肥大化させない)
+    cache = {key: old_cache[key] for key in cache_keys.values() if key in old_cache}
+    results: dict[Path, list[dict]] = {}
+    pending: list[Path] = []
     for pdf_path in pdf_paths:
+        key = cache_keys[pdf_path]
         try:
-            menus = ocr_pdf(client, pdf_path)
-            for item in menus:
-                # 後勝ちで dedup
-                all_menus[item["date"]] = item
-        except Exception as e:
-            logger.error("OCR 失敗 (%s): %s", pdf_path.name, e)
+            cached = _validate_menu_list(cache.pop(key, []), pdf_path.name)
+        except ValueError as e:
+            logger.warning("OCR キャッシュが不正なため再 OCR します: %s", e)
+            cached = []
+        if cached:  # 空の結果は使わずに OCR し直す
+            results[pdf_path] = cache[key] = cached
+            logger.info("OCR キャッシュを使用: %s (%d 日分)", pdf_path.name, len(cached))
+        else:
+            pending.append(pdf_path)
+
+    if pending:
+        client = _get_client()
+        limiter = _RateLimiter(OCR_RPS)
+        batch_size = max(OCR_BATCH_SIZE, 1)
+        batches = [
+            pending[i : i + batch_size] for i in range(0, len(pending), batch_size)
+        ]
+
+        with ThreadPoolExecutor(max_workers=OCR_CONCURRENCY) as executor:
+            futures = {
+                executor.submit(
+                    _ocr_batch_or_single, client, batch, prompt, limiter
+                ): batch
+                for batch in batches
+            }
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    batch_results = future.result()
+                except Exception as e:
+                    names = ", ".join(p.name for p in batch)
+                    logger.error("OCR 失敗 (%s): %s", names, e)
+                    continue
+                results.update(batch_results)
+                # 検証済みの結果だけが渡ってくる。空の結果は次回 OCR し直すため保存しない
+                for pdf_path, menus in batch_results.items():
+                    if menus:
+                        cache[cache_keys[pdf_path]] = menus
+
+    if pending or cache.keys() != old_cache.keys():
+        _save_ocr_cache(cache)
+
+    # 完了順ではなく入力順で後勝ち dedup する
+    all_menus: dict[str, dict] = {}
+    for pdf_path in pdf_paths:
+        for item in results.get(pdf_path, []):
+            all_menus[item["date"]] = item
 
     result = sorted(all_menus.values(), key=lambda x: x["date"])
     logger.info("合計 %d 日分のメニューデータを生成", len(result))
     return result
 
 
+# load_menu_data のキャッシュ: ((パス, mtime_ns, サイズ), メニューリスト, 日付 → メニュー)
+_menu_cache: tuple[tuple[Path, int, int], list[dict], dict[str, dict]] | None = None
+_menu_cache_lock = threading.Lock()
+
+
+def _invalidate_menu_cache() -> None:
+    global _menu_cache
+    with _menu_cache_lock:
+        _menu_cache = None
+
+
 def save_menu_data(menu_list: list[dict], output_path: Path | None = None) -> Path:
     """メニューデータを JSON ファイルに保存する。"""
     output_path = output_path or MENU_FILE
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(menu_list, f, ensure_ascii=False, indent=2)
+    output_path.write_bytes(_json_dumps(menu_list))
+    # mtime の分解能によっては変更を検知できないため明示的に破棄する
+    _invalidate_menu_cache()
     logger.info("メニューデータを保存: %s (%d 件)", output_path, len(menu_list))
     return output_path
 
 
-def load_menu_data(path: Path | None = None) -> list[dict]:
-    """保存済みメニューデータを読み込む。"""
+def load_menu_index(path: Path | None = None) -> tuple[list[dict], dict[str, dict]]:
+    """メニューリストと日付インデックスを返す。
+
+    ファイルの mtime とサイズが変わらなければキャッシュを使う (stat 1 回のみ)。
+    """
+    global _menu_cache
     path = path or MENU_FILE
-    if not path.exists():
-        return []
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return [], {}
+    key = (path, st.st_mtime_ns, st.st_size)
+
+    with _menu_cache_lock:
+        if _menu_cache and _menu_cache[0] == key:
+            return _menu_cache[1], _menu_cache[2]
+
+        data = _json_loads(path.read_bytes())
+        by_date = {item["date"]: item for item in data}
+        _menu_cache = (key, data, by_date)
+        return data, by_date
+
+
+def load_menu_data(path: Path | None = None) -> list[dict]:
+    """保存済みメニューデータを読み込む。
+
+    ファイルの mtime とサイズが変わらない限り、前回パースした結果を返す。
+    """
+    return load_menu_index(path)[0]
@@ -4,16 +4,19 @@ order.sh の Python 移植版。httpx でログイン → トークン取得 →
 認証情報は .env から読み込む。Cookie を保存して再利用することでログイン回数を削減。
 """
 
+import atexit
 import json
 import logging
 import os
 import re
+import threading
 from dataclasses import dataclass, field
 from datetime import datetime
+from typing import Iterator
 
 import httpx
 
-from lunch_bot.config import BROWSER_HEADERS, COOKIE_FILE, ORDER_BASE_URL
+from lunch_bot.config import BROWSER_HEADERS, COOKIE_FILE, HTML_PARSER, ORDER_BASE_URL
 
 logger = logging.getLogger(__name__)
 
@@ -30,9 +33,27 @@ MENU_TYPE_MAP: dict[str, int] = {
     "other": 2,
 }
 
+# _resolve_menu_index 用: 小文字化したキーとインデックス文字列も含めた検索表
+_MENU_INDEX_LOOKUP: dict[str, int] = {
+    **MENU_TYPE_MAP,
+    **{k.lower(): v for k, v in MENU_TYPE_MAP.items()},
+    "0": 0,
+    "1": 1,
+    "2": 2,
+}
+
 # インデックス → 表示名
 MENU_INDEX_NAME: dict[int, str] = {0: "和風ランチ", 1: "あいランチ", 2: "その他"}
 
+# HTML 解析用の正規表現（呼び出しごとのコンパイル / キャッシュ参照を避ける）
+_TOKEN_RE1 = re.compile(r'name="__RequestVerificationToken"\s+[^>]*value="([^"]*)"')
+_TOKEN_RE2 = re.compile(r'value="([^"]*)"\s+[^>]*name="__RequestVerificationToken"')
+_QTY_RE = re.compile(r'id="\[(\d+)\]\.変更前数量"\s*value="(\d+)"')
+_MONTHLY_RE = re.compile(r"([\w]+(?:らんち|ランチ|その他))\s*(\d+)個")
+_DAY_RE = re.compile(r"(\d+)\(.\)")
+# 注文一覧のセル内テキスト (get_text と同じく <script> / <style> の中身は除く)
+_CELL_TEXT_XPATH = ".//text()[not(ancestor::script or ancestor::style)]"
+
 
 @dataclass
 class OrderResult:
@@ -57,6 +78,30 @@ class DayOrderStatus:
 
 # ─────────────────────────── helpers ───────────────────────────
 
+# MCP ツール呼び出し間で接続 (TCP + TLS) と Cookie を再利用する共有クライアント
+_client: httpx.Client | None = None
+_client_lock = threading.Lock()
+
+# BROWSER_HEADERS はクライアント側で設定済みなので、リクエストごとには差分だけ渡す
+_TOP_REFERER = {"Referer": f"{ORDER_BASE_URL}/"}
+_TOP_REFERER_ORIGIN = {**_TOP_REFERER, "Origin": ORDER_BASE_URL}
+
+
+def _get_client() -> httpx.Client:
+    """共有 httpx クライアントを取得する。初回呼び出し時に生成する。"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = httpx.Client(
+                follow_redirects=True,
+                timeout=30,
+                http2=True,
+                headers=BROWSER_HEADERS,
+                limits=httpx.Limits(max_keepalive_connections=4),
+            )
+            atexit.register(_client.close)
+        return _client
+
 
 def _get_credentials() -> tuple[str, str, str]:
     """認証情報を .env から取得する。"""
@@ -109,13 +154,8 @@ def _load_cookies(client: httpx.Client) -> bool:
 
 def _is_session_valid(client: httpx.Client) -> bool:
     """保存された Cookie でセッションが有効か確認する。"""
-    headers = BROWSER_HEADERS.copy()
     try:
-        resp = client.get(
-            f"{ORDER_BASE_URL}/Order",
-            headers=headers,
-            follow_redirects=False,
-        )
+        resp = client.get(f"{ORDER_BASE_URL}/Order", follow_redirects=False)
         # ログインページにリダイレクトされなければ有効
         if resp.status_code == 200:
             return True
@@ -133,13 +173,7 @@ def _is_session_valid(client: httpx.Client) -> bool:
 
 def _extract_token(html: str) -> str:
     """HTML から __RequestVerificationToken を抽出する。"""
-    match = re.search(
-        r'name="__RequestVerificationToken"\s+[^>]*value="([^"]*)"', html
-    )
-    if not match:
-        match = re.search(
-            r'value="([^"]*)"\s+[^>]*name="__RequestVerificationToken"', html
-        )
+    match = _TOKEN_RE1.search(html) or _TOKEN_RE2.search(html)
     if not match:
         raise RuntimeError("リクエスト検証トークンが取得できませんでした。")
     return match.group(1)
@@ -147,15 +181,15 @@ def _extract_token(html: str) -> str:
 
 def _resolve_menu_index(menu_type: str) -> int:
     """メニュー種別文字列をインデックスに変換する。"""
-    key = (
-        menu_type.strip().lower()
-        if menu_type.strip().lower() in MENU_TYPE_MAP
-        else menu_type.strip()
-    )
-    if key in MENU_TYPE_MAP:
-        return MENU_TYPE_MAP[key]
+    key = menu_type.strip()
+    idx = _MENU_INDEX_LOOKUP.get(key)
+    if idx is None:
+        idx = _MENU_INDEX_LOOKUP.get(key.lower())
+    if idx is not None:
+        return idx
+    # "01" などの表記は int() で解釈する
     try:
-        idx = int(menu_type)
+        idx = int(key)
         if idx in (0, 1, 2):
             return idx
     except ValueError:
@@ -194,50 +228,48 @@ def place_order(date: str, menu_type: str, quantity: int) -> OrderResult:
 
     quantities = [0, 0, 0]
     quantities[menu_index] = quantity
-    headers = BROWSER_HEADERS.copy()
 
-    with httpx.Client(follow_redirects=True, timeout=30) as client:
-        # 1. ログイン（保存 Cookie を優先使用）
-        logger.info("[1/3] 認証処理...")
-        if not _login(client):
-            return OrderResult(
-                success=False,
-                message="ログインに失敗しました。認証情報を確認してください。",
-                date=date,
-                menu_type=menu_type,
-                quantity=quantity,
-            )
-
-        # 2. 注文ページ → トークン取得
-        logger.info("[2/3] 注文ページ取得 (日付: %s)...", order_date)
-        order_url = (
-            f"{ORDER_BASE_URL}/Order/CreateDetails"
-            f"?dt={order_date}&kbn=1&err=false"
-        )
-        order_resp = client.get(
-            order_url,
-            headers={**headers, "Referer": f"{ORDER_BASE_URL}/"},
+    client = _get_client()
+    # 1. ログイン（保存 Cookie を優先使用）
+    logger.info("[1/3] 認証処理...")
+    if not _login(client):
+        return OrderResult(
+            success=False,
+            message="ログインに失敗しました。認証情報を確認してください。",
+            date=date,
+            menu_type=menu_type,
+            quantity=quantity,
         )
-        order_resp.raise_for_status()
-        order_token = _extract_token(order_resp.text)
-
-        # 3. 注文送信 (リダイレクトを追わずにレスポンスを確認)
-        action = "取り消し" if quantity == 0 else "注文"
-        logger.info("[3/3] %s送信 (メニュー: %s, 数量: %d)...", action, menu_type, quantity)
-
-        # follow_redirects=False で送信してリダイレクト先を確認
-        with httpx.Client(cookies=client.cookies, timeout=30) as post_client:
-            post_resp = post_client.post(
-                order_url,
-                data={
-                    "__RequestVerificationToken": order_token,
-                    "[0].数量": str(quantities[0]),
-                    "[1].数量": str(quantities[1]),
-                    "[2].数量": str(quantities[2]),
-                },
-                headers={**headers, "Referer": order_url, "Origin": ORDER_BASE_URL},
-                follow_redirects=False,
-            )
+
+    # 2. 注文ページ → トークン取得
+    logger.info("[2/3] 注文ページ取得 (日付: %s)...", order_date)
+    order_url = (
+        f"{ORDER_BASE_URL}/Order/CreateDetails"
+        f"?dt={order_date}&kbn=1&err=false"
+    )
+    order_resp = client.get(
+        order_url,
+        headers=_TOP_REFERER,
+    )
+    order_resp.raise_for_status()
+    order_token = _extract_token(order_resp.text)
+
+    # 3. 注文送信 (リダイレクトを追わずにレスポンスを確認)
+    action = "取り消し" if quantity == 0 else "注文"
+    logger.info("[3/3] %s送信 (メニュー: %s, 数量: %d)...", action, menu_type, quantity)
+
+    # follow_redirects=False で送信してリダイレクト先を確認
+    post_resp = client.post(
+        order_url,
+        data={
+            "__RequestVerificationToken": order_token,
+            "[0].数量": str(quantities[0]),
+            "[1].数量": str(quantities[1]),
+            "[2].数量": str(quantities[2]),
+        },
+        headers={"Referer": order_url, "Origin": ORDER_BASE_URL},
+        follow_redirects=False,
+    )
 
     menu_name = {0: "和風ランチ", 1: "あいランチ", 2: "その他"}.get(
         menu_index, menu_type
@@ -301,9 +333,8 @@ def _login(client: httpx.Client, force: bool = False) -> bool:
         logger.info("保存された Cookie が無効、再ログインします")
 
     company_cd, user_cd, password = _get_credentials()
-    headers = BROWSER_HEADERS.copy()
 
-    login_resp = client.get(f"{ORDER_BASE_URL}/", headers=headers)
+    login_resp = client.get(f"{ORDER_BASE_URL}/")
     login_resp.raise_for_status()
     login_token = _extract_token(login_resp.text)
 
@@ -315,7 +346,7 @@ def _login(client: httpx.Client, force: bool = False) -> bool:
             "UserCD": user_cd,
             "Password": password,
         },
-        headers={**headers, "Referer": f"{ORDER_BASE_URL}/", "Origin": ORDER_BASE_URL},
+        headers=_TOP_REFERER_ORIGIN,
     )
     auth_cookies = [c for c in client.cookies.jar if c.name == ".ASPXAUTH"]
     if auth_cookies:
@@ -331,23 +362,22 @@ def get_order_status(date: str) -> DayOrderStatus:
         date: 対象日 (YYYY-MM-DD or YYYY/MM/DD)
     """
     order_date = _normalize_date(date)
-    headers = BROWSER_HEADERS.copy()
 
-    with httpx.Client(follow_redirects=True, timeout=30) as client:
-        if not _login(client):
-            raise RuntimeError("ログインに失敗しました。")
+    client = _get_client()
+    if not _login(client):
+        raise RuntimeError("ログインに失敗しました。")
 
-        url = (
-            f"{ORDER_BASE_URL}/Order/CreateDetails"
-            f"?dt={order_date}&kbn=1&err=false"
-        )
-        resp = client.get(url, headers={**headers, "Referer": f"{ORDER_BASE_URL}/"})
-        resp.raise_for_status()
-        html = resp.text
+    url = (
+        f"{ORDER_BASE_URL}/Order/CreateDetails"
+        f"?dt={order_date}&kbn=1&err=false"
+    )
+    resp = client.get(url, headers=_TOP_REFERER)
+    resp.raise_for_status()
+    html = resp.text
 
     # [i].変更前数量 から現在の注文数を取得
     orders: dict[str, int] = {}
-    for m in re.finditer(r'id="\[(\d+)\]\.変更前数量"\s*value="(\d+)"', html):
+    for m in _QTY_RE.finditer(html):
         idx = int(m.group(1))
         qty = int(m.group(2))
         name = MENU_INDEX_NAME.get(idx, f"メニュー{idx}")
@@ -357,6 +387,50 @@ def get_order_status(date: str) -> DayOrderStatus:
     return DayOrderStatus(date=date, orders=orders)
 
 
+def _iter_order_rows_soup(html: str) -> Iterator[tuple[str, str]]:
+    """BeautifulSoup で注文一覧テーブルの各行を解析する (フォールバック用)。"""
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    soup = BeautifulSoup(html, HTML_PARSER, parse_only=SoupStrainer("tr"))
+    for tr in soup.find_all("tr"):
+        cells = tr.find_all("td")
+        if len(cells) >= 2:
+            yield cells[0].get_text(strip=True), cells[1].get_text(strip=True)
+
+
+def _iter_order_rows(html: str) -> Iterator[tuple[str, str]]:
+    """注文一覧テーブルの各行から (1列目, 2列目) のテキストを取り出す。
+
+    lxml (C 実装) で直接 XPath を引き、入っていなければ BeautifulSoup で解析する。
+    テキストは BeautifulSoup の get_text(strip=True) と同じく断片ごとに strip して連結する。
+    """
+    if not html.strip():
+        return  # 空のページには行がない (lxml は空文書をエラーにする)
+
+    try:
+        from lxml import etree
+        from lxml import html as lxml_html
+    except ImportError:
+        yield from _iter_order_rows_soup(html)
+        return
+
+    try:
+        root = lxml_html.fromstring(html)
+    except etree.ParserError:  # コメントだけの文書なども「空」として扱う
+        return
+    except ValueError:
+        # XML の encoding 宣言付きの文字列は lxml が受け付けない
+        yield from _iter_order_rows_soup(html)
+        return
+    for tr in root.xpath("//tr"):
+        cells = tr.xpath("./td")
+        if len(cells) >= 2:
+            yield (
+                "".join(t.strip() for t in cells[0].xpath(_CELL_TEXT_XPATH)),
+                "".join(t.strip() for t in cells[1].xpath(_CELL_TEXT_XPATH)),
+            )
+
+
 def get_monthly_orders(year: int, month: int) -> list[DayOrderStatus]:
     """月全体の注文状況を取得する。
 
@@ -364,41 +438,27 @@ def get_monthly_orders(year: int, month: int) -> list[DayOrderStatus]:
         year: 年 (例: 2026)
         month: 月 (1-12)
     """
-    headers = BROWSER_HEADERS.copy()
-
-    with httpx.Client(follow_redirects=True, timeout=30) as client:
-        if not _login(client):
-            raise RuntimeError("ログインに失敗しました。")
-
-        resp = client.get(
-            f"{ORDER_BASE_URL}/Order?idx={month}",
-            headers={**headers, "Referer": f"{ORDER_BASE_URL}/"},
-        )
-        resp.raise_for_status()
+    client = _get_client()
+    if not _login(client):
+        raise RuntimeError("ログインに失敗しました。")
 
-    # BeautifulSoup でテーブル行をパース
-    from bs4 import BeautifulSoup
+    resp = client.get(
+        f"{ORDER_BASE_URL}/Order?idx={month}",
+        headers=_TOP_REFERER,
+    )
+    resp.raise_for_status()
 
-    soup = BeautifulSoup(resp.text, "html.parser")
     results: list[DayOrderStatus] = []
 
-    for tr in soup.find_all("tr"):
-        cells = tr.find_all("td")
-        if len(cells) < 2:
-            continue
-
+    for day_text, order_text in _iter_order_rows(resp.text):
         # 1列目: "10(火)" のような日付
-        day_text = cells[0].get_text(strip=True)
-        day_match = re.match(r"(\d+)\(.\)", day_text)
+        day_match = _DAY_RE.match(day_text)
         if not day_match:
             continue
         day = int(day_match.group(1))
         date_str = f"{year}-{month:02d}-{day:02d}"
 
-        # 2列目: 注文内容
-        order_text = cells[1].get_text(strip=True)
-
-        # 休業日チェック
+        # 休業日チェック (2列目: 注文内容)
         if "休業日" in order_text:
             results.append(
                 DayOrderStatus(date=date_str, holiday=True, holiday_label=order_text)
@@ -407,7 +467,7 @@ def get_monthly_orders(year: int, month: int) -> list[DayOrderStatus]:
 
         # "和風らんち　1個あいランチ　2個" → {和風ランチ: 1, あいランチ: 2}
         orders: dict[str, int] = {}
-        for m in re.finditer(r"([\w]+(?:らんち|ランチ|その他))\s*(\d+)個", order_text):
+        for m in _MONTHLY_RE.finditer(order_text):
             name = m.group(1)
             qty = int(m.group(2))
             # 和風らんち → 和風ランチ に統一
@@ -11,12 +11,18 @@ MCPツール:
 
 import logging
 import re
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Iterator
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from functools import lru_cache
 
 from mcp.server.fastmcp import FastMCP
 
 from lunch_bot.downloader import download_all_menus
-from lunch_bot.ocr import load_menu_data, ocr_all_menus, save_menu_data
+from lunch_bot.ocr import load_menu_index, ocr_all_menus, save_menu_data
 from lunch_bot.order import cancel_order as _cancel_order
 from lunch_bot.order import get_monthly_orders as _get_monthly_orders
 from lunch_bot.order import get_order_status as _get_order_status
@@ -43,86 +49,282 @@ def create_mcp(host: str = "127.0.0.1", port: int = 8765) -> FastMCP:
 # ─────────────────────────── helpers ───────────────────────────
 
 
-def _load_menu() -> list[dict]:
-    return load_menu_data()
+MenuIndex = tuple[list[dict], dict[str, dict]]
 
 
-def _ensure_menu_for_date(target_date: str) -> list[dict]:
+# 直前の読み込みからこの秒数以内なら、既知の日付はファイルを stat せずメモリ上から返す
+_MENU_RECHECK_INTERVAL = 5.0
+
+# 最後に読み込んだ (メニューリスト, 日付 → メニュー) と、その時刻 (time.monotonic)
+_last_index: tuple[MenuIndex, float] | None = None
+
+
+def _load_menu() -> MenuIndex:
+    """(メニューリスト, 日付 → メニュー) を返す。ファイルが変わらなければキャッシュ済み。"""
+    global _last_index
+    index = load_menu_index()
+    _last_index = (index, time.monotonic())
+    return index
+
+
+@dataclass(frozen=True)
+class _MenuView:
+    """メニューリストから派生させた検索・表示用の文字列。
+
+    行ごとの dict ではなく列ごとのリストで持ち、i 番目の要素が menu_list[i] に対応する。
+    元の dict には書き込まないので、保存データに余計なキーは混ざらない。
+    """
+
+    dates: list[str]
+    ai_lower: list[str]  # 小文字化済みのあいランチ
+    wafu_lower: list[str]  # 小文字化済みの和風ランチ
+    ai_lines: list[str]  # "  🍱 あいランチ: ..."
+    wafu_lines: list[str]  # "  🐟 和風ランチ: ..."
+    listing: str  # list_all_menus の本文 (全日分)
+    details: dict[str, str]  # 日付 → get_lunch_menu の表示
+    sorted_dates: list[str]  # 重複なしの日付 (昇順)
+    available: str  # 見つからなかったときに示す利用可能な日付 (先頭のみ)
+
+
+# 見つからなかったときに列挙する日付の最大数
+_AVAILABLE_DATES_LIMIT = 10
+
+
+# (元のメニューリスト, ビュー)
+_menu_view: tuple[list[dict], _MenuView] | None = None
+
+
+def _get_menu_view(menu_list: list[dict]) -> _MenuView:
+    """メニューリストのビューを返す。
+
+    メニューリストが再読み込みされる (別オブジェクトになる) までは使い回す。
+    """
+    global _menu_view
+    cached = _menu_view
+    if cached is not None and cached[0] is menu_list:
+        return cached[1]
+
+    dates = [item["date"] for item in menu_list]
+    ai_lower = [item["ai_lunch"].lower() for item in menu_list]
+    wafu_lower = [item["wafu_lunch"].lower() for item in menu_list]
+
+    ai_lines, wafu_lines, entries = [], [], []
+    details: dict[str, str] = {}
+    for date, item in zip(dates, menu_list):
+        ai, wafu = item["ai_lunch"], item["wafu_lunch"]
+        ai_lines.append(f"  🍱 あいランチ: {ai}")
+        wafu_lines.append(f"  🐟 和風ランチ: {wafu}")
+        entries.append(f"📅 {date}\n{ai_lines[-1]}\n{wafu_lines[-1]}")
+        details[date] = f"📅 {date} のランチメニュー\n🍱 あいランチ: {ai}\n🐟 和風ランチ: {wafu}"
+
+    sorted_dates = sorted(details)
+    available = ", ".join(sorted_dates[:_AVAILABLE_DATES_LIMIT])
+    if len(sorted_dates) > _AVAILABLE_DATES_LIMIT:
+        available += f", ...他{len(sorted_dates) - _AVAILABLE_DATES_LIMIT}件"
+
+    view = _MenuView(
+        dates,
+        ai_lower,
+        wafu_lower,
+        ai_lines,
+        wafu_lines,
+        "\n\n".join(entries),
+        details,
+        sorted_dates,
+        available,
+    )
+    _menu_view = (menu_list, view)
+    return view
+
+
+def _nearest_dates(view: _MenuView, target: str) -> list[str]:
+    """target (YYYY-MM-DD) の直前・直後にある利用可能な日付を最大 3 件返す。
+
+    ISO 形式の日付は文字列順が日付順なので、パースせずに二分探索できる。
+    """
+    i = bisect_left(view.sorted_dates, target)
+    return view.sorted_dates[max(0, i - 1) : i + 2]
+
+
+def _match_all(ai: str, wafu: str, keywords: list[str]) -> tuple[bool, bool] | None:
+    """全キーワードがどちらかのメニューに含まれれば (あいランチに一致, 和風ランチに一致) を返す。
+
+    全キーワード一致の判定とメニューごとの一致を 1 回の走査で求める。
+    含まれないキーワードがあれば None。
+    """
+    ai_hit = wafu_hit = False
+    for kw in keywords:
+        in_ai, in_wafu = kw in ai, kw in wafu
+        if not (in_ai or in_wafu):
+            return None
+        ai_hit |= in_ai
+        wafu_hit |= in_wafu
+    return ai_hit, wafu_hit
+
+
+def _match_keywords(keywords: list[str], view: _MenuView) -> Iterator[tuple[int, bool, bool]]:
+    """全キーワードを含む行について (行番号, あいランチに一致, 和風ランチに一致) を返す。"""
+    unique = list(dict.fromkeys(keywords))
+    hits = [
+        (i, lanes)
+        for i, (ai, wafu) in enumerate(zip(view.ai_lower, view.wafu_lower))
+        if (lanes := _match_all(ai, wafu, unique)) is not None
+    ]
+    for i, (ai_hit, wafu_hit) in hits:
+        yield i, ai_hit, wafu_hit
+
+
+def _ensure_menu_for_date(target_date: str, now: datetime | None = None) -> MenuIndex:
     """指定日付のメニューがなければ、PDFダウンロード→OCRを実行してデータを更新する。
 
     Args:
         target_date: YYYY-MM-DD 形式の日付
+        now: 現在時刻 (省略時は datetime.now())
 
     Returns:
-        更新後のメニューリスト
+        更新後の (メニューリスト, 日付 → メニュー)
     """
-    menu_list = load_menu_data()
+    # 直前に読み込んだインデックスに該当日付があれば、ファイルを見ずに返す
+    last = _last_index
+    if last is not None and time.monotonic() - last[1] < _MENU_RECHECK_INTERVAL:
+        if target_date in last[0][1]:
+            return last[0]
+
+    menu_list, menu_by_date = _load_menu()
 
     # 該当日付があればそのまま返す
-    if any(item["date"] == target_date for item in menu_list):
-        return menu_list
+    if target_date in menu_by_date:
+        return menu_list, menu_by_date
 
     # 日付をパース
     try:
         target = datetime.strptime(target_date, "%Y-%m-%d")
     except ValueError:
-        return menu_list  # パース失敗ならそのまま返す
+        return menu_list, menu_by_date  # パース失敗ならそのまま返す
 
-    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    today = (now or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
 
     # 過去または30日より先の未来は更新しない
     if target < today or target > today + timedelta(days=30):
-        return menu_list
+        return menu_list, menu_by_date
+
+    _refresh_menu_data(target_date)
+    return _load_menu()
+
+
+# 直前の更新からこの秒数以内の取りこぼしは、同じ結果になるので再実行しない
+MENU_REFRESH_COOLDOWN = 60.0
+
+# 実行中の自動更新 (なければ None)。完了すると set される
+_refresh_event: threading.Event | None = None
+_last_refresh_at: float | None = None  # 最後に更新が完了した時刻 (time.monotonic)
+_refresh_lock = threading.Lock()
+
+
+def _refresh_menu_data(target_date: str) -> None:
+    """PDF ダウンロード → OCR → 保存を実行する。
+
+    更新はどの日付でも全 PDF が対象なので、実行中に別のスレッドから呼ばれた場合は
+    新たに実行せず、実行中の更新の完了を待つ。直前に更新が完了したばかりの場合も
+    その結果を使い回し、短時間に続いた取りこぼしを 1 回の OCR にまとめる。
+    """
+    global _refresh_event, _last_refresh_at
+    with _refresh_lock:
+        if (
+            _last_refresh_at is not None
+            and time.monotonic() - _last_refresh_at < MENU_REFRESH_COOLDOWN
+        ):
+            logger.info("直前の自動更新結果を使用 (対象: %s)", target_date)
+            return
+        event = _refresh_event
+        leader = event is None
+        if leader:
+            event = _refresh_event = threading.Event()
+
+    if not leader:
+        logger.info("⏳ 実行中のメニュー自動更新を待機中 (対象: %s)...", target_date)
+        event.wait()
+        return
 
-    # PDF ダウンロード → OCR 実行
     logger.info("📥 メニューデータを自動更新中 (対象: %s)...", target_date)
+    refreshed = False
     try:
         pdf_paths = download_all_menus()
         if pdf_paths:
             new_menus = ocr_all_menus(pdf_paths)
             if new_menus:
-                save_menu_data(new_menus)
+                save_menu_data(new_menus)  # 保存時にキャッシュも破棄される
                 logger.info("✅ メニューデータを更新しました (%d 日分)", len(new_menus))
-                return new_menus
+                # PDF ごとの失敗はログだけで握りつぶされるので、保存できたときだけ成功扱い
+                refreshed = True
     except Exception as e:
         logger.warning("⚠️ メニューデータの自動更新に失敗: %s", e)
-
-    return menu_list
+    finally:
+        with _refresh_lock:
+            _refresh_event = None
+            if refreshed:
+                _last_refresh_at = time.monotonic()
+        event.set()
+
+
+# 直接指定の日付: YYYY-MM-DD / YYYY/MM/DD / M/D / M月D日
+_DATE_RE = re.compile(
+    r"(?P<y>\d{4})(?P<sep>[-/])(?P<m>\d{1,2})(?P=sep)(?P<d>\d{1,2})"
+    r"|(?P<m2>\d{1,2})(?:/(?P<d2>\d{1,2})|月(?P<d3>\d{1,2})日)"
+)
+# 相対日付 → 今日からの日数
+_RELATIVE_DAYS: dict[str, int] = {
+    "今日": 0,
+    "きょう": 0,
+    "明日": 1,
+    "あした": 1,
+    "あす": 1,
+    "明後日": 2,
+    "あさって": 2,
+}
+# 曜日指定 (次の〇曜日 / 来週の〇曜日)
+_WD_RE = re.compile(r"(来週)?の?([月火水木金土日])曜")
+_WEEKDAYS: dict[str, int] = {"月": 0, "火": 1, "水": 2, "木": 3, "金": 4, "土": 5, "日": 6}
+
+
+def _resolve_date_query(query: str, now: datetime | None = None) -> str | None:
+    """自然言語の日付表現を YYYY-MM-DD に変換する。
+
+    結果は (クエリ, 今日の日付) ごとにキャッシュする。日付が変わればキーも変わる。
+    now を渡せば、ツール呼び出し内で現在時刻を取り直さずに済む。
+    """
+    return _resolve_date_query_cached(query.strip(), (now or datetime.now()).toordinal())
 
 
-def _resolve_date_query(query: str) -> str | None:
-    """自然言語の日付表現を YYYY-MM-DD に変換する。"""
-    today = datetime.now()
+@lru_cache(maxsize=256)
+def _resolve_date_query_cached(q: str, today_ord: int) -> str | None:
+    today = datetime.fromordinal(today_ord)
 
     # 直接日付形式
-    for fmt in ("%Y-%m-%d", "%Y/%m/%d", "%m/%d", "%m月%d日"):
+    m = _DATE_RE.fullmatch(q)
+    if m:
+        if m["y"]:
+            year, month, day = int(m["y"]), int(m["m"]), int(m["d"])
+        else:
+            year, month, day = today.year, int(m["m2"]), int(m["d2"] or m["d3"])
         try:
-            dt = datetime.strptime(query.strip(), fmt)
-            if dt.year == 1900:
-                dt = dt.replace(year=today.year)
-            return dt.strftime("%Y-%m-%d")
+            return datetime(year, month, day).strftime("%Y-%m-%d")
         except ValueError:
-            continue
+            pass  # 存在しない日付
 
     # 相対日付
-    q = query.strip()
-    if q in ("今日", "きょう"):
-        return today.strftime("%Y-%m-%d")
-    if q in ("明日", "あした", "あす"):
-        return (today + timedelta(days=1)).strftime("%Y-%m-%d")
-    if q in ("明後日", "あさって"):
-        return (today + timedelta(days=2)).strftime("%Y-%m-%d")
+    days = _RELATIVE_DAYS.get(q)
+    if days is not None:
+        return (today + timedelta(days=days)).strftime("%Y-%m-%d")
 
     # 曜日指定 (次の〇曜日 / 来週の〇曜日)
-    weekdays = {"月": 0, "火": 1, "水": 2, "木": 3, "金": 4, "土": 5, "日": 6}
-    for name, wd in weekdays.items():
-        if name in q and "曜" in q:
-            days_ahead = (wd - today.weekday()) % 7
-            if days_ahead == 0 and "来週" in q:
-                days_ahead = 7
-            elif "来週" in q:
-                days_ahead += 7
-            return (today + timedelta(days=days_ahead)).strftime("%Y-%m-%d")
+    m = _WD_RE.search(q)
+    if m:
+        days_ahead = (_WEEKDAYS[m.group(2)] - today.weekday()) % 7
+        # "来週 月曜" のように離れていても来週扱いにする
+        if m.group(1) or "来週" in q:
+            days_ahead += 7
+        return (today + timedelta(days=days_ahead)).strftime("%Y-%m-%d")
 
     return None
 
@@ -137,24 +339,26 @@ def get_lunch_menu(date_str: str) -> str:
     Args:
         date_str: 日付 (YYYY-MM-DD, YYYY/MM/DD, M/D, "今日", "明日", "来週の月曜日" など)
     """
-    target = _resolve_date_query(date_str) or date_str.strip()
+    now = datetime.now()
+    resolved = _resolve_date_query(date_str, now)
+    target = resolved or date_str.strip()
 
     # 該当日付がなければ自動でPDFダウンロード→OCRを試みる
-    menu_list = _ensure_menu_for_date(target)
+    menu_list, _ = _ensure_menu_for_date(target, now)
 
     if not menu_list:
         return "メニューデータが見つかりません。先にパイプラインを実行してください。"
 
-    for item in menu_list:
-        if item["date"] == target:
-            return (
-                f"📅 {target} のランチメニュー\n"
-                f"🍱 あいランチ: {item['ai_lunch']}\n"
-                f"🐟 和風ランチ: {item['wafu_lunch']}"
-            )
+    view = _get_menu_view(menu_list)
+    detail = view.details.get(target)
+    if detail:
+        return detail
 
-    available = ", ".join(i["date"] for i in menu_list)
-    return f"{target} のメニューは見つかりませんでした。\n利用可能な日付: {available}"
+    message = f"{target} のメニューは見つかりませんでした。\n利用可能な日付: {view.available}"
+    nearest = _nearest_dates(view, resolved) if resolved else []
+    if nearest:
+        message += f"\n近い日付: {', '.join(nearest)}"
+    return message
 
 
 @mcp.tool()
@@ -165,39 +369,40 @@ def search_menu(query: str) -> str:
         query: 検索キーワード (例: "フライ", "ハンバーグ", "来週", "2月10日")
     """
     # 日付として解決を試みる
-    resolved = _resolve_date_query(query)
+    now = datetime.now()
+    resolved = _resolve_date_query(query, now)
     if resolved:
         # 該当日付がなければ自動でPDFダウンロード→OCRを試みる
-        menu_list = _ensure_menu_for_date(resolved)
+        menu_list, _ = _ensure_menu_for_date(resolved, now)
         if not menu_list:
             return "メニューデータが見つかりません。"
 
-        for item in menu_list:
-            if item["date"] == resolved:
-                return (
-                    f"📅 {resolved} のランチメニュー\n"
-                    f"🍱 あいランチ: {item['ai_lunch']}\n"
-                    f"🐟 和風ランチ: {item['wafu_lunch']}"
-                )
-        return f"{resolved} のメニューは見つかりませんでした。"
+        view = _get_menu_view(menu_list)
+        detail = view.details.get(resolved)
+        if detail:
+            return detail
+        message = f"{resolved} のメニューは見つかりませんでした。"
+        nearest = _nearest_dates(view, resolved)
+        if nearest:
+            message += f"\n近い日付: {', '.join(nearest)}"
+        return message
 
     # キーワード検索
-    menu_list = _load_menu()
+    menu_list, _ = _load_menu()
     if not menu_list:
         return "メニューデータが見つかりません。"
 
-    keywords = query.strip().split()
+    keywords = [kw.lower() for kw in query.strip().split()]
     results: list[str] = []
 
-    for item in menu_list:
-        combined = f"{item['ai_lunch']} {item['wafu_lunch']}"
-        if all(kw.lower() in combined.lower() for kw in keywords):
-            matched = []
-            if any(kw.lower() in item["ai_lunch"].lower() for kw in keywords):
-                matched.append(f"  🍱 あいランチ: {item['ai_lunch']}")
-            if any(kw.lower() in item["wafu_lunch"].lower() for kw in keywords):
-                matched.append(f"  🐟 和風ランチ: {item['wafu_lunch']}")
-            results.append(f"📅 {item['date']}\n" + "\n".join(matched))
+    view = _get_menu_view(menu_list)
+    for i, ai_hit, wafu_hit in _match_keywords(keywords, view):
+        matched = []
+        if ai_hit:
+            matched.append(view.ai_lines[i])
+        if wafu_hit:
+            matched.append(view.wafu_lines[i])
+        results.append(f"📅 {view.dates[i]}\n" + "\n".join(matched))
 
     if results:
         return f"「{query}」の検索結果 ({len(results)} 件):\n\n" + "\n\n".join(results)
@@ -208,18 +413,12 @@ def search_menu(query: str) -> str:
 @mcp.tool()
 def list_all_menus() -> str:
     """登録されている全てのランチメニュー一覧を表示します。"""
-    menu_list = _load_menu()
+    menu_list, _ = _load_menu()
     if not menu_list:
         return "メニューデータが見つかりません。"
 
-    lines = [f"📋 全メニュー一覧 ({len(menu_list)} 日分)\n"]
-    for item in menu_list:
-        lines.append(
-            f"📅 {item['date']}\n"
-            f"  🍱 あいランチ: {item['ai_lunch']}\n"
-            f"  🐟 和風ランチ: {item['wafu_lunch']}"
-        )
-    return "\n\n".join(lines)
+    header = f"📋 全メニュー一覧 ({len(menu_list)} 日分)\n"
+    return f"{header}\n\n{_get_menu_view(menu_list).listing}"
 
 
 @mcp.tool()
@@ -263,10 +462,10 @@ def get_order_status(date_str: str) -> str:
     Args:
         date_str: 日付 (YYYY-MM-DD, "今日", "明日", "今月", "来月", "2月" など)
     """
-    today = datetime.now()
+    now = datetime.now()
 
     # 月全体の照会
-    month_query = _resolve_month_query(date_str)
+    month_query = _resolve_month_query(date_str, now)
     if month_query:
         year, month = month_query
         try:
@@ -292,7 +491,7 @@ def get_order_status(date_str: str) -> str:
         return "\n".join(lines)
 
     # 特定日の照会
-    target = _resolve_date_query(date_str) or date_str.strip()
+    target = _resolve_date_query(date_str, now) or date_str.strip()
     try:
         status = _get_order_status(target)
     except Exception as e:
@@ -305,29 +504,38 @@ def get_order_status(date_str: str) -> str:
     return f"📅 {target} の注文状況: {order_str}"
 
 
-def _resolve_month_query(query: str) -> tuple[int, int] | None:
-    """月の照会クエリを (year, month) に解決する。"""
-    today = datetime.now()
-    q = query.strip()
+# 月指定: "2月" / "2026年2月"
+_MONTH_RE = re.compile(r"(\d{1,2})月")
+_YM_RE = re.compile(r"(\d{4})年(\d{1,2})月")
+
+
+def _resolve_month_query(query: str, now: datetime | None = None) -> tuple[int, int] | None:
+    """月の照会クエリを (year, month) に解決する。
+
+    結果は (クエリ, 今日の年, 月) ごとにキャッシュする。月が変わればキーも変わる。
+    """
+    today = now or datetime.now()
+    return _resolve_month_query_cached(query.strip(), today.year, today.month)
+
 
+@lru_cache(maxsize=128)
+def _resolve_month_query_cached(q: str, year: int, month: int) -> tuple[int, int] | None:
     if q in ("今月", "こんげつ"):
-        return (today.year, today.month)
+        return (year, month)
     if q in ("来月", "らいげつ"):
-        nxt = today.replace(day=1) + timedelta(days=32)
-        return (nxt.year, nxt.month)
+        return (year + (month == 12), month % 12 + 1)
     if q in ("先月", "せんげつ"):
-        prev = today.replace(day=1) - timedelta(days=1)
-        return (prev.year, prev.month)
+        return (year - (month == 1), (month - 2) % 12 + 1)
 
     # "2月", "12月" etc.
-    m = re.match(r"(\d{1,2})月$", q)
+    m = _MONTH_RE.fullmatch(q)
     if m:
-        month = int(m.group(1))
-        if 1 <= month <= 12:
-            return (today.year, month)
+        n = int(m.group(1))
+        if 1 <= n <= 12:
+            return (year, n)
 
     # "2026年2月" etc.
-    m = re.match(r"(\d{4})年(\d{1,2})月$", q)
+    m = _YM_RE.fullmatch(q)
     if m:
         return (int(m.group(1)), int(m.group(2)))
 